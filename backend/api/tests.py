@@ -0,0 +1,549 @@
+import importlib
+import threading
+import warnings
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+import orjson
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+from openai import RateLimitError
+
+from . import urls, views
+from .renderers import ORJSONRenderer
+from .views import (
+    AI_MAX_TOKENS,
+    AI_MIN_OUTPUT_TOKENS,
+    AI_OUTPUT_TOKEN_HEADROOM,
+    BATCH_MAX_INPUT_TOKENS,
+    CHARS_PER_TOKEN,
+    chunk_batch_items,
+    is_trivial_code,
+    normalize_code,
+    parse_ai_json,
+    review_cache_key,
+    review_max_tokens,
+    select_model,
+)
+
+
+def fake_completion(content):
+    """Build an object shaped like an OpenAI chat completion."""
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def review(summary):
+    return {'issues': [], 'summary': summary, 'score': 8}
+
+
+class ParseAIJsonTests(SimpleTestCase):
+    def test_plain_json(self):
+        self.assertEqual(parse_ai_json('{"score": 7}'), {'score': 7})
+
+    def test_markdown_code_block(self):
+        self.assertEqual(parse_ai_json('Here you go:\n```json\n{"score": 7}\n```'), {'score': 7})
+
+    def test_brackets_before_object(self):
+        self.assertEqual(parse_ai_json('Sure! Note [1]: {"issues": [], "score": 7}'), {'issues': [], 'score': 7})
+
+    def test_array(self):
+        self.assertEqual(parse_ai_json('Here you go:\n```json\n[{"index": 0}]\n```', list), [{'index': 0}])
+        self.assertEqual(parse_ai_json('Reviews: [{"index": 0, "issues": []}]', list), [{'index': 0, 'issues': []}])
+
+    def test_invalid_json(self):
+        with self.assertRaises(orjson.JSONDecodeError):
+            parse_ai_json('not json at all')
+
+
+class TrivialCodeTests(SimpleTestCase):
+    def test_short_code(self):
+        self.assertTrue(is_trivial_code('x = 1', 'python'))
+
+    def test_python_comments(self):
+        self.assertTrue(is_trivial_code('# first comment line\n# second comment line', 'python'))
+
+    def test_block_comment(self):
+        code = '/*\n * A block comment that\n * spans several lines\n */'
+        self.assertTrue(is_trivial_code(code, 'javascript'))
+
+    def test_code_after_block_comment(self):
+        self.assertFalse(is_trivial_code('/* setup */ int value = compute(42);', 'c'))
+
+    def test_pointer_dereference_is_code(self):
+        self.assertFalse(is_trivial_code('* ptr_value = compute(42);', 'c'))
+
+    def test_python_print_of_literals(self):
+        self.assertTrue(is_trivial_code('print("hello, world, again")', 'python'))
+        self.assertTrue(is_trivial_code('print("total:", 42, sep=" ")', 'python'))
+
+    def test_python_literal(self):
+        self.assertTrue(is_trivial_code('"""Module docstring only."""', 'python'))
+
+    def test_python_one_line_calls_are_reviewed(self):
+        self.assertFalse(is_trivial_code('os.system("rm -rf " + input("dir please: "))', 'python'))
+        self.assertFalse(is_trivial_code('subprocess.call(request.args["cmd"], shell=True)', 'python'))
+        self.assertFalse(is_trivial_code('print(open("/etc/passwd").read())', 'python'))
+
+    def test_trivial_review_has_no_score(self):
+        self.assertNotIn('score', views.TRIVIAL_REVIEW)
+
+    def test_python_function(self):
+        self.assertFalse(is_trivial_code('def add(a, b):\n    return a + b', 'python'))
+
+    def test_python_syntax_error(self):
+        self.assertFalse(is_trivial_code('def broken(:\n    return something', 'python'))
+
+
+@mock.patch('api.views.get_token_encoding', return_value=None)
+class ChunkBatchItemsTests(SimpleTestCase):
+    def test_small_items_share_a_chunk(self, _):
+        items = [(0, 'a = 1', 'python'), (1, 'b = 2', 'python')]
+        self.assertEqual(chunk_batch_items(items), [items])
+
+    def test_chunks_split_on_token_budget(self, _):
+        code = 'x' * (BATCH_MAX_INPUT_TOKENS // 2 * CHARS_PER_TOKEN)
+        items = [(index, code, 'python') for index in range(3)]
+        self.assertEqual(chunk_batch_items(items), [[items[0]], [items[1]], [items[2]]])
+
+    def test_oversized_item_gets_its_own_chunk(self, _):
+        big = (0, 'x' * (BATCH_MAX_INPUT_TOKENS * CHARS_PER_TOKEN * 2), 'python')
+        small = (1, 'y = 2', 'python')
+        self.assertEqual(chunk_batch_items([big, small]), [[big], [small]])
+
+    def test_empty(self, _):
+        self.assertEqual(chunk_batch_items([]), [])
+
+
+class SelectModelTests(SimpleTestCase):
+    def test_by_size(self):
+        self.assertEqual(select_model(100, 'python'), 'gpt-4o-mini')
+        self.assertEqual(select_model(5000, 'python'), 'gpt-4o')
+
+    def test_language_override(self):
+        self.assertEqual(select_model(1500, 'python'), 'gpt-4o-mini')
+        self.assertEqual(select_model(1500, 'cpp'), 'gpt-4o')
+
+    def test_beyond_table_uses_last_model(self):
+        self.assertEqual(select_model(50000, 'python'), 'gpt-4o')
+
+    def test_uses_normalized_length(self):
+        code = 'x = 1' + ' ' * 3000 + '\n'
+        self.assertEqual(select_model(len(normalize_code(code)), 'python'), 'gpt-4o-mini')
+
+
+class ReviewMaxTokensTests(SimpleTestCase):
+    def test_lower_bound(self):
+        self.assertGreaterEqual(review_max_tokens(0), AI_MIN_OUTPUT_TOKENS)
+        self.assertEqual(review_max_tokens(0), max(AI_MIN_OUTPUT_TOKENS, AI_OUTPUT_TOKEN_HEADROOM))
+
+    def test_scales_with_input(self):
+        self.assertEqual(review_max_tokens(500), 500 + AI_OUTPUT_TOKEN_HEADROOM)
+
+    def test_upper_bound(self):
+        self.assertEqual(review_max_tokens(100000), AI_MAX_TOKENS)
+
+
+@override_settings(OPENAI_API_KEY='test')
+class ViewTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        views._local_review_cache.clear()
+        patcher = mock.patch('api.views.get_token_encoding', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, name, payload):
+        return self.client.post(reverse(name), orjson.dumps(payload), content_type='application/json')
+
+
+class ReviewViewTests(ViewTestCase):
+    def test_review_rejects_non_string_language(self):
+        response = self.post('code-review', {'code': 'def f():\n    return 1', 'language': ['python']})
+        self.assertEqual(response.status_code, 400)
+
+    def test_review_rejects_non_object_body(self):
+        with mock.patch('api.views.safe_capture_exception') as capture:
+            response = self.post('code-review', [{'code': 'def f():\n    return 1'}])
+        self.assertEqual(response.status_code, 400)
+        capture.assert_not_called()
+
+    def test_batch_rejects_non_string_language(self):
+        response = self.post('code-review-batch', {'items': [{'code': 'def f():\n    return 1', 'language': {}}]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_rejects_non_object_body(self):
+        response = self.post('code-review-batch', [{'code': 'def f():\n    return 1'}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_demultiplexes_reviews(self):
+        items = [
+            {'code': 'def add(a, b):\n    return a + b', 'language': 'python'},
+            {'code': 'def sub(a, b):\n    return a - b', 'language': 'python'},
+        ]
+        # Answers may come back in any order; the index ties them to their item
+        content = orjson.dumps([{'index': 1, **review('sub')}, {'index': 0, **review('add')}]).decode()
+        with mock.patch('api.views.create_chat_completion', new=mock.AsyncMock(return_value=fake_completion(content))) as create:
+            response = self.post('code-review-batch', {'items': items})
+
+        self.assertEqual(create.await_count, 1)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['review']['summary'] for result in results], ['add', 'sub'])
+        self.assertEqual([result['cached'] for result in results], [False, False])
+
+        # The reviews are cached per item
+        with mock.patch('api.views.create_chat_completion', new=mock.AsyncMock()) as create:
+            response = self.post('code-review-batch', {'items': items})
+        create.assert_not_awaited()
+        self.assertEqual([result['cached'] for result in response.json()['results']], [True, True])
+
+    def test_batch_partial_failure(self):
+        small = 'def add(a, b):\n    return a + b'
+        large = 'def big():\n' + '    value = compute(42)\n' * 200
+
+        async def create_chat_completion(model, **kwargs):
+            if model == select_model(len(large), 'python'):
+                raise RuntimeError('upstream error')
+            return fake_completion(orjson.dumps([{'index': 0, **review('add')}]).decode())
+
+        self.assertNotEqual(select_model(len(small), 'python'), select_model(len(large), 'python'))
+        with mock.patch('api.views.create_chat_completion', new=create_chat_completion):
+            response = self.post('code-review-batch', {'items': [
+                {'code': small, 'language': 'python'},
+                {'code': large, 'language': 'python'},
+                {'code': 'x = 1', 'language': 'python'},
+            ]})
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(results[0]['review']['summary'], 'add')
+        self.assertEqual(results[1], {'index': 1, 'error': 'AI analysis failed'})
+        self.assertEqual(results[2]['review'], views.TRIVIAL_REVIEW)
+
+    def test_batch_missing_index_fails_only_that_item(self):
+        items = [
+            {'code': 'def add(a, b):\n    return a + b', 'language': 'python'},
+            {'code': 'def sub(a, b):\n    return a - b', 'language': 'python'},
+        ]
+        content = orjson.dumps([{'index': 0, **review('add')}]).decode()
+        with mock.patch('api.views.create_chat_completion', new=mock.AsyncMock(return_value=fake_completion(content))):
+            response = self.post('code-review-batch', {'items': items})
+
+        results = response.json()['results']
+        self.assertEqual(results[0]['review']['summary'], 'add')
+        self.assertEqual(results[1], {'index': 1, 'error': 'AI analysis failed'})
+
+
+class ReviewCacheTests(ViewTestCase):
+    code = 'def add(a, b):\n    return a + b'
+
+    def test_miss_then_hit(self):
+        completion = fake_completion(orjson.dumps(review('add')).decode())
+        with mock.patch('api.views.create_chat_completion', new=mock.AsyncMock(return_value=completion)) as create:
+            first = self.post('code-review', {'code': self.code})
+            second = self.post('code-review', {'code': self.code + '   \r\n'})
+
+        self.assertEqual(create.await_count, 1)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.json()['review'], review('add'))
+
+    def test_key_covers_max_tokens_and_prompt(self):
+        key = review_cache_key(self.code, 'python', max_tokens=300)
+        self.assertNotEqual(key, review_cache_key(self.code, 'python', max_tokens=400))
+        self.assertNotEqual(key, review_cache_key(self.code, 'python', max_tokens=300, prompt='batch'))
+
+    def test_batch_does_not_share_single_reviews(self):
+        completion = fake_completion(orjson.dumps(review('single')).decode())
+        with mock.patch('api.views.create_chat_completion', new=mock.AsyncMock(return_value=completion)):
+            self.post('code-review', {'code': self.code})
+
+        content = orjson.dumps([{'index': 0, **review('batch')}]).decode()
+        with mock.patch('api.views.create_chat_completion', new=mock.AsyncMock(return_value=fake_completion(content))) as create:
+            response = self.post('code-review-batch', {'items': [{'code': self.code}]})
+
+        self.assertEqual(create.await_count, 1)
+        self.assertEqual(response.json()['results'][0], {'index': 0, 'review': review('batch'), 'cached': False})
+
+
+def fake_openai_client(completion=None):
+    """Build a stand-in AsyncOpenAI client returning completion."""
+    client = mock.MagicMock()
+    client.chat.completions.create = mock.AsyncMock(return_value=completion)
+    client.close = mock.AsyncMock()
+    return client
+
+
+@mock.patch('api.views._shared_openai_client', None)
+class OpenAIRequestScopeTests(ViewTestCase):
+    async def test_request_scope_closes_its_client(self):
+        client = fake_openai_client()
+        with mock.patch('api.views._new_openai_client', return_value=client) as new_client:
+            async with views.openai_request_scope(False):
+                self.assertIs(views.get_openai_client(), client)
+                self.assertIs(views.get_openai_client(), client)
+            client.close.assert_awaited_once()
+            self.assertEqual(new_client.call_count, 1)
+
+    async def test_unused_request_scope_creates_no_client(self):
+        with mock.patch('api.views._new_openai_client') as new_client:
+            async with views.openai_request_scope(False):
+                pass
+        new_client.assert_not_called()
+
+    async def test_shared_scope_keeps_the_process_client(self):
+        client = fake_openai_client()
+        with mock.patch('api.views._new_openai_client', return_value=client) as new_client:
+            for _ in range(2):
+                async with views.openai_request_scope(True):
+                    self.assertIs(views.get_openai_client(), client)
+        self.assertEqual(new_client.call_count, 1)
+        client.close.assert_not_awaited()
+
+    def test_wsgi_request_closes_its_client(self):
+        client = fake_openai_client(fake_completion(orjson.dumps(review('add')).decode()))
+        with mock.patch('api.views._new_openai_client', return_value=client):
+            response = self.post('code-review', {'code': 'def add(a, b):\n    return a + b'})
+
+        self.assertEqual(response.status_code, 200)
+        client.chat.completions.create.assert_awaited_once()
+        client.close.assert_awaited_once()
+
+
+    def test_read_timeout_fits_max_tokens(self):
+        self.assertGreater(views.completion_timeout(views.BATCH_MAX_OUTPUT_TOKENS), views.completion_timeout(AI_MAX_TOKENS))
+        self.assertGreater(views.completion_timeout(AI_MAX_TOKENS), views.OPENAI_HTTP_TIMEOUT.read)
+
+    async def test_call_timeout_sized_to_max_tokens(self):
+        client = fake_openai_client()
+        with mock.patch('api.views._new_openai_client', return_value=client):
+            async with views.openai_request_scope(False):
+                await views.create_chat_completion(model='gpt-4o', max_tokens=AI_MAX_TOKENS)
+
+        timeout = client.chat.completions.create.call_args.kwargs['timeout']
+        self.assertEqual(timeout.read, views.completion_timeout(AI_MAX_TOKENS))
+        self.assertEqual(timeout.connect, views.OPENAI_HTTP_TIMEOUT.connect)
+
+
+def rate_limit_error():
+    request = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')
+    return RateLimitError('rate limited', response=httpx.Response(429, request=request), body=None)
+
+
+@override_settings(OPENAI_MAX_CONCURRENCY=1)
+@mock.patch('api.views._shared_openai_semaphore', None)
+class CreateChatCompletionTests(SimpleTestCase):
+    async def test_semaphore_per_request_scope(self):
+        async with views.openai_request_scope(False):
+            semaphore = views.get_openai_semaphore()
+            self.assertIs(views.get_openai_semaphore(), semaphore)
+        async with views.openai_request_scope(False):
+            self.assertIsNot(views.get_openai_semaphore(), semaphore)
+
+    async def test_semaphore_shared_without_scope(self):
+        semaphore = views.get_openai_semaphore()
+        async with views.openai_request_scope(True):
+            self.assertIs(views.get_openai_semaphore(), semaphore)
+
+    def test_client_does_not_retry(self):
+        with override_settings(OPENAI_API_KEY='test'):
+            self.assertEqual(views._new_openai_client().max_retries, 0)
+
+    async def test_rate_limit_retried_outside_semaphore(self):
+        client = fake_openai_client()
+        client.chat.completions.create.side_effect = [rate_limit_error(), rate_limit_error(), 'done']
+        semaphore_locked = []
+
+        async def sleep(seconds):
+            semaphore_locked.append(views.get_openai_semaphore().locked())
+
+        with mock.patch('api.views._new_openai_client', return_value=client):
+            async with views.openai_request_scope(False):
+                result = await views.create_chat_completion.retry_with(sleep=sleep)(model='gpt-4o-mini', max_tokens=300)
+
+        self.assertEqual(result, 'done')
+        self.assertEqual(client.chat.completions.create.await_count, 3)
+        self.assertEqual(semaphore_locked, [False, False])
+
+    async def test_gives_up_after_four_attempts(self):
+        client = fake_openai_client()
+        client.chat.completions.create.side_effect = rate_limit_error()
+
+        with mock.patch('api.views._new_openai_client', return_value=client):
+            async with views.openai_request_scope(False):
+                with self.assertRaises(RateLimitError):
+                    await views.create_chat_completion.retry_with(sleep=mock.AsyncMock())(model='gpt-4o-mini', max_tokens=300)
+
+        self.assertEqual(client.chat.completions.create.await_count, 4)
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    def test_render(self):
+        data = {'review': {'issues': [], 'summary': 'résumé', 'score': 9}, 'response_time': 1.25}
+        self.assertEqual(orjson.loads(ORJSONRenderer().render(data)), data)
+
+    def test_render_none(self):
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+    def test_render_lazy_string(self):
+        self.assertEqual(ORJSONRenderer().render({'error': gettext_lazy('Not found')}), b'{"error":"Not found"}')
+
+    def test_render_unsupported_type(self):
+        with self.assertRaises(TypeError):
+            ORJSONRenderer().render({'value': object()})
+
+    def test_default_renderer(self):
+        response = self.client.post(reverse('code-review'), b'{"code": ""}', content_type='application/json')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(orjson.loads(response.content), {'error': 'Code is required and must be a string'})
+
+
+class FakeStream:
+    """Stand-in for an OpenAI completion stream yielding parts as deltas."""
+
+    def __init__(self, parts, on_chunk=None):
+        self.parts = parts
+        self.on_chunk = on_chunk or (lambda: None)
+        self.close = mock.AsyncMock()
+
+    async def __aiter__(self):
+        for part in self.parts:
+            self.on_chunk()
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=part))])
+
+
+@override_settings(OPENAI_MAX_CONCURRENCY=1)
+@mock.patch('api.views._shared_openai_client', None)
+@mock.patch('api.views._shared_openai_semaphore', None)
+class StreamReviewTests(ViewTestCase):
+    code = 'def add(a, b):\n    return a + b'
+
+    async def stream(self, payload):
+        response = await self.async_client.post(
+            reverse('code-review'), orjson.dumps(payload), content_type='application/json'
+        )
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        return response, [orjson.loads(line) for line in content.splitlines()]
+
+    async def test_stream_records(self):
+        semaphore_locked = []
+        body = orjson.dumps(review('add')).decode()
+        stream = FakeStream(
+            [body[:10], body[10:]],
+            on_chunk=lambda: semaphore_locked.append(views.get_openai_semaphore().locked())
+        )
+        client = fake_openai_client(stream)
+        with mock.patch('api.views._new_openai_client', return_value=client):
+            response, records = await self.stream({'code': self.code, 'stream': True})
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(records[:2], [{'type': 'delta', 'content': body[:10]}, {'type': 'delta', 'content': body[10:]}])
+        self.assertEqual(records[2]['type'], 'review')
+        self.assertEqual(records[2]['review'], review('add'))
+        self.assertEqual(client.chat.completions.create.call_args.kwargs['stream'], True)
+        # The concurrency slot is held while the stream is read, then released
+        self.assertEqual(semaphore_locked, [True, True])
+        self.assertFalse(views.get_openai_semaphore().locked())
+        stream.close.assert_awaited_once()
+
+        # The streamed review was cached
+        response, records = await self.stream({'code': self.code, 'stream': True})
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual([record['type'] for record in records], ['review'])
+        self.assertEqual(records[0]['review'], review('add'))
+
+    async def test_stream_parse_error(self):
+        stream = FakeStream(['not json'])
+        with mock.patch('api.views._new_openai_client', return_value=fake_openai_client(stream)):
+            response, records = await self.stream({'code': self.code, 'stream': True})
+
+        self.assertEqual(records[-1], {'type': 'error', 'error': 'Failed to parse AI response'})
+        self.assertFalse(views.get_openai_semaphore().locked())
+
+    def test_stream_requires_true(self):
+        completion = fake_completion(orjson.dumps(review('add')).decode())
+        with mock.patch('api.views.create_chat_completion', new=mock.AsyncMock(return_value=completion)):
+            response = self.post('code-review', {'code': self.code, 'stream': 'false'})
+
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.json()['review'], review('add'))
+
+
+class SentryInstrumentationTests(ViewTestCase):
+    def test_review_tags_without_deprecated_calls(self):
+        completion = fake_completion(orjson.dumps(review('add')).decode())
+        with mock.patch('sentry_sdk.get_client') as get_client, \
+                mock.patch('sentry_sdk.set_tag') as set_tag, \
+                mock.patch('api.views._telemetry_executor') as executor, \
+                mock.patch('api.views.create_chat_completion', new=mock.AsyncMock(return_value=completion)), \
+                warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always', DeprecationWarning)
+            get_client.return_value.is_active.return_value = True
+            response = self.post('code-review', {'code': 'def add(a, b):\n    return a + b'})
+
+        self.assertEqual(response.status_code, 200)
+        set_tag.assert_any_call('response_time_category', 'fast')
+        executor.submit.assert_called_once()
+        self.assertEqual([str(warning.message) for warning in caught if warning.category is DeprecationWarning], [])
+
+
+class SentryDebugRouteTests(SimpleTestCase):
+    def routes(self):
+        return [str(pattern.pattern) for pattern in importlib.reload(urls).urlpatterns]
+
+    def tearDown(self):
+        importlib.reload(urls)
+
+    def test_hidden_in_production(self):
+        with override_settings(DEBUG=False):
+            self.assertNotIn('sentry-debug/', self.routes())
+
+    def test_exposed_in_development(self):
+        with override_settings(DEBUG=True):
+            self.assertIn('sentry-debug/', self.routes())
+
+
+class CodeLengthBucketTests(SimpleTestCase):
+    def test_buckets(self):
+        self.assertEqual(
+            [views.code_length_bucket(length) for length in (0, 999, 1000, 4999, 5000, 10000)],
+            ['small', 'small', 'medium', 'medium', 'large', 'large']
+        )
+
+
+class ReviewTelemetryTests(ViewTestCase):
+    def test_thresholds(self):
+        with mock.patch('api.views.safe_capture_message') as capture:
+            views.emit_review_telemetry(1.0, 100, 'python')
+            capture.assert_not_called()
+            views.emit_review_telemetry(3.0, 100, 'python')
+            self.assertEqual(capture.call_args.kwargs['level'], 'info')
+            views.emit_review_telemetry(6.0, 100, 'python')
+            self.assertEqual(capture.call_args.kwargs['level'], 'warning')
+
+    def test_sent_from_background_thread(self):
+        done = threading.Event()
+        calls = []
+
+        def emit(response_time, code_length, language):
+            calls.append((threading.current_thread().name, code_length, language))
+            done.set()
+
+        completion = fake_completion(orjson.dumps(review('add')).decode())
+        code = 'def add(a, b):\n    return a + b'
+        with mock.patch('sentry_sdk.get_client') as get_client, \
+                mock.patch('api.views.emit_review_telemetry', new=emit), \
+                mock.patch('api.views.create_chat_completion', new=mock.AsyncMock(return_value=completion)):
+            get_client.return_value.is_active.return_value = True
+            response = self.post('code-review', {'code': code})
+            self.assertTrue(done.wait(5))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(calls), 1)
+        thread_name, code_length, language = calls[0]
+        self.assertTrue(thread_name.startswith('review-telemetry'))
+        self.assertEqual((code_length, language), (len(code), 'python'))
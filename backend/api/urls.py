@@ -1,5 +1,6 @@
+from django.conf import settings
 from django.urls import path
-from .views import CodeReviewView
+from .views import CodeReviewBatchView, CodeReviewView
 
 def trigger_error(request):
     """Trigger a test error for Sentry debugging."""
@@ -7,5 +8,9 @@ def trigger_error(request):
 
 urlpatterns = [
     path('review/', CodeReviewView.as_view(), name='code-review'),
-    path('sentry-debug/', trigger_error)
+    path('review/batch/', CodeReviewBatchView.as_view(), name='code-review-batch'),
 ]
+
+# Sentry test route, only exposed in development
+if settings.DEBUG:
+    urlpatterns.append(path('sentry-debug/', trigger_error))
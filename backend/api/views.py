@@ -1,15 +1,166 @@
-import json
+import ast
+import asyncio
+import contextlib
+import contextvars
+import hashlib
 import logging
+import re
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import orjson
 from django.conf import settings
-from rest_framework.views import APIView
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from adrf.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 import sentry_sdk
-from openai import OpenAI
+import tiktoken
+from openai import APIConnectionError, AsyncOpenAI, InternalServerError, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 
 logger = logging.getLogger(__name__)
 
+# Default model, also used to load the tokenizer at startup
+AI_MODEL = "gpt-4o-mini"
+# Model by code length: the first entry whose limit covers the code is used
+MODEL_BY_SIZE = [
+    (500, "gpt-4o-mini"),
+    (2000, "gpt-4o-mini"),
+    (10000, "gpt-4o"),
+]
+# Languages whose larger snippets move to the bigger model sooner
+MODEL_BY_SIZE_FOR_LANGUAGE = {
+    "c": [(1000, "gpt-4o-mini"), (10000, "gpt-4o")],
+    "cpp": [(1000, "gpt-4o-mini"), (10000, "gpt-4o")],
+}
+AI_TEMPERATURE = 0.3
+AI_MAX_TOKENS = 2000
+# Output budget per review: input tokens plus headroom, within these bounds
+AI_MIN_OUTPUT_TOKENS = 256
+AI_OUTPUT_TOKEN_HEADROOM = 300
+REVIEW_CACHE_PREFIX = "cr:"
+# Size of the in-process review cache checked before the shared cache
+LOCAL_REVIEW_CACHE_SIZE = 256
+MAX_CODE_LENGTH = 10000
+# Code shorter than this (ignoring surrounding whitespace) is not sent to the AI
+TRIVIAL_CODE_LENGTH = 20
+
+# No score: the code was never actually reviewed
+TRIVIAL_REVIEW = {
+    "issues": [],
+    "summary": "Code too trivial to review.",
+}
+
+# (line comment prefix, (block comment start, end) or None) per language;
+# the other languages the frontend offers all use C-style comments
+COMMENT_SYNTAX = {
+    "python": ("#", None),
+}
+DEFAULT_COMMENT_SYNTAX = ("//", ("/*", "*/"))
+
+# Batch reviews: several snippets are sent to OpenAI in a single prompt
+BATCH_MAX_ITEMS = 50
+BATCH_MAX_INPUT_TOKENS = 6000
+BATCH_MAX_OUTPUT_TOKENS = 16000
+# Rough characters-per-token ratio, used only if the tokenizer is unavailable
+CHARS_PER_TOKEN = 4
+
+SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are a code review assistant. Always respond with valid JSON only.",
+}
+
+# The invariant instructions come first and the submitted code last, so every
+# request shares a byte-identical prefix that OpenAI's prompt cache can reuse.
+REVIEW_PROMPT_TEMPLATE = """Analyze the code below and provide a code review.
+Return a JSON response with the following structure:
+{{
+    "issues": [
+        {{
+            "line": <line_number>,
+            "severity": "<error|warning|info>",
+            "message": "<description>",
+            "suggestion": "<suggested_fix>"
+        }}
+    ],
+    "summary": "<overall_summary>",
+    "score": <0-100>
+}}
+Only return the JSON, no other text.
+
+Language: {language}
+Code to review:
+```
+{code}
+```"""
+
+BATCH_PROMPT_TEMPLATE = """Analyze each of the numbered code items below and provide a code review for each one.
+Return a JSON array with one entry per item, using the following structure:
+[
+    {{
+        "index": <item_index>,
+        "issues": [
+            {{
+                "line": <line_number>,
+                "severity": "<error|warning|info>",
+                "message": "<description>",
+                "suggestion": "<suggested_fix>"
+            }}
+        ],
+        "summary": "<overall_summary>",
+        "score": <0-100>
+    }}
+]
+Line numbers are relative to the start of each item. Only return the JSON, no other text.
+
+{items}"""
+
+BATCH_ITEM_TEMPLATE = """### Item {index} (lang={language})
+```
+{code}
+```
+"""
+
+# Expected top-level type -> regex finding that JSON value in an AI
+# response, optionally inside a ```json fence
+_AI_JSON_RES = {
+    dict: re.compile(r"```(?:json)?\s*(\{.*\})\s*```|(\{.*\})", re.DOTALL),
+    list: re.compile(r"```(?:json)?\s*(\[.*\])\s*```|(\[.*\])", re.DOTALL),
+}
+
+# Encoding name -> tiktoken encoding, or None while loading or after a failure
+_token_encodings = {}
+_token_encodings_lock = threading.Lock()
+
+# Runs Sentry bookkeeping that should not delay the HTTP response
+_telemetry_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="review-telemetry")
+
+# key -> (expires_at, review), most recently used last
+_local_review_cache = OrderedDict()
+_local_review_cache_lock = threading.Lock()
+
+# HTTP/2 lets concurrent OpenAI calls share one TCP+TLS connection
+OPENAI_HTTP_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=50)
+# The read timeout bounds the wait between streamed chunks; a non-streamed
+# completion sends nothing until it is done, so its read timeout also
+# allows for generating max_tokens at OPENAI_MIN_TOKENS_PER_SECOND
+OPENAI_HTTP_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+OPENAI_MIN_TOKENS_PER_SECOND = 20
+
+# Under ASGI every request in a worker runs on the same event loop, so one
+# AsyncOpenAI client and its connection pool are shared by all of them, as
+# is the semaphore bounding concurrent OpenAI calls per worker
+_shared_openai_client = None
+_shared_openai_semaphore = None
+# Under WSGI each async view runs in its own short-lived event loop; the
+# request's OpenAI resources live here and are closed when it ends
+_request_openai_scope = contextvars.ContextVar("request_openai_scope", default=None)
+
 
 def safe_capture_exception(exception, **kwargs):
     """
@@ -17,7 +168,7 @@ def safe_capture_exception(exception, **kwargs):
     
     Args:
         exception: The exception to capture
-        **kwargs: Additional context (tags, extra, etc.)
+        **kwargs: Additional context (tags, extras, etc.)
     """
     try:
         sentry_sdk.capture_exception(exception, **kwargs)
@@ -33,7 +184,7 @@ def safe_capture_message(message, level="info", **kwargs):
     Args:
         message: The message to capture
         level: Severity level (debug, info, warning, error, fatal)
-        **kwargs: Additional context (tags, extra, etc.)
+        **kwargs: Additional context (tags, extras, etc.)
     """
     try:
         sentry_sdk.capture_message(message, level=level, **kwargs)
@@ -42,162 +193,708 @@ def safe_capture_message(message, level="info", **kwargs):
         logger.warning(f"Sentry message capture failed: {message}")
 
 
+def code_length_bucket(code_length):
+    """
+    Bucket a code length for use as a low-cardinality Sentry tag.
+
+    Exact lengths belong in ``extras``, which Sentry does not index.
+    """
+    if code_length < 1000:
+        return "small"
+    if code_length < 5000:
+        return "medium"
+    return "large"
+
+
+def get_token_encoding(model):
+    """
+    Return the tiktoken encoding for a model, or None if it is not loaded.
+
+    tiktoken downloads its vocabulary on first use, with no timeout, so the
+    first call for an encoding starts that download on a background thread
+    and callers estimate token counts until it has finished. A failed
+    download is not retried.
+    """
+    try:
+        name = tiktoken.encoding_name_for_model(model)
+    except KeyError:
+        return None
+    with _token_encodings_lock:
+        if name in _token_encodings:
+            return _token_encodings[name]
+        _token_encodings[name] = None
+    threading.Thread(target=_load_token_encoding, args=(name,), name=f"tiktoken-{name}", daemon=True).start()
+    return None
+
+
+def _load_token_encoding(name):
+    try:
+        encoding = tiktoken.get_encoding(name)
+    except Exception:
+        logger.warning(f"Tokenizer {name} unavailable, estimating token counts", exc_info=True)
+        return
+    with _token_encodings_lock:
+        _token_encodings[name] = encoding
+
+
+def count_tokens(text, model=AI_MODEL):
+    """
+    Count the tokens text uses for a model.
+    """
+    encoding = get_token_encoding(model)
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    # Submitted code may contain special-token text such as <|endoftext|>
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def select_model(code_length, language):
+    """
+    Pick the cheapest model suited to the size and language of the code.
+    """
+    size_table = MODEL_BY_SIZE_FOR_LANGUAGE.get(language, MODEL_BY_SIZE)
+    for limit, model in size_table:
+        if code_length <= limit:
+            return model
+    return size_table[-1][1]
+
+
+def review_max_tokens(input_tokens):
+    """
+    Size the output budget of a review to its input.
+
+    OpenAI reserves capacity for the full max_tokens, so small snippets
+    asking for less get scheduled sooner.
+    """
+    return max(AI_MIN_OUTPUT_TOKENS, min(AI_MAX_TOKENS, input_tokens + AI_OUTPUT_TOKEN_HEADROOM))
+
+
+def emit_review_telemetry(response_time, code_length, language):
+    """
+    Report slow and normal review response times to Sentry.
+
+    Runs on a background thread so the HTTP response is not held up.
+    """
+    if response_time > 5.0:
+        safe_capture_message(
+            f"Slow code review response: {response_time:.2f}s",
+            level="warning",
+            tags={
+                "performance": "slow_response",
+                "language": language,
+                "threshold": "5s"
+            },
+            extras={
+                "response_time": response_time,
+                "code_length": code_length,
+                "language": language
+            }
+        )
+    elif response_time > 2.0:
+        # Log normal response times at info level
+        safe_capture_message(
+            f"Code review completed: {response_time:.2f}s",
+            level="info",
+            tags={
+                "performance": "normal_response",
+                "language": language
+            }
+        )
+
+
+def _new_openai_client():
+    http_client = httpx.AsyncClient(
+        http2=True,
+        limits=OPENAI_HTTP_LIMITS,
+        timeout=OPENAI_HTTP_TIMEOUT,
+    )
+    # create_chat_completion() does the retrying, outside the concurrency limit
+    return AsyncOpenAI(api_key=settings.OPENAI_API_KEY, http_client=http_client, max_retries=0)
+
+
+def completion_timeout(max_tokens):
+    """
+    Return the timeout for a non-streamed completion of up to max_tokens.
+    """
+    return OPENAI_HTTP_TIMEOUT.read + max_tokens / OPENAI_MIN_TOKENS_PER_SECOND
+
+
+def get_openai_client():
+    """
+    Return the AsyncOpenAI client for the current request.
+
+    Inside a per-request scope (WSGI) the client is created on first use and
+    closed with the scope; otherwise the process-wide client is used.
+    """
+    global _shared_openai_client
+    scope = _request_openai_scope.get()
+    if scope is None:
+        if _shared_openai_client is None:
+            _shared_openai_client = _new_openai_client()
+        return _shared_openai_client
+    if 'client' not in scope:
+        scope['client'] = _new_openai_client()
+    return scope['client']
+
+
+def uses_shared_openai_client(request):
+    """
+    Return True if the request is served over ASGI, on the worker's long-lived loop.
+    """
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+@contextlib.asynccontextmanager
+async def openai_request_scope(shared):
+    """
+    Scope the OpenAI resources used inside the block to the current request.
+
+    With ``shared`` (ASGI) this does nothing. Otherwise the client and
+    semaphore used in the block belong to the request, and the client is
+    closed on exit, so a WSGI request does not leave its event loop and
+    sockets behind.
+    """
+    if shared:
+        yield
+        return
+    scope = {}
+    token = _request_openai_scope.set(scope)
+    try:
+        yield
+    finally:
+        _request_openai_scope.reset(token)
+        if 'client' in scope:
+            await scope['client'].close()
+
+
+def get_openai_semaphore():
+    """
+    Return the semaphore limiting in-flight OpenAI calls.
+
+    Like the client, it is per request inside an openai_request_scope()
+    (a WSGI request's loop ends with it) and process-wide otherwise.
+    """
+    global _shared_openai_semaphore
+    scope = _request_openai_scope.get()
+    if scope is None:
+        if _shared_openai_semaphore is None:
+            _shared_openai_semaphore = asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENCY)
+        return _shared_openai_semaphore
+    if 'semaphore' not in scope:
+        scope['semaphore'] = asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENCY)
+    return scope['semaphore']
+
+
+# Rate-limited, timed-out and failed OpenAI calls are retried with
+# exponential backoff (the client's own retries are disabled)
+_openai_retry = retry(
+    retry=retry_if_exception_type((RateLimitError, APIConnectionError, InternalServerError)),
+    wait=wait_exponential(multiplier=1, max=20),
+    stop=stop_after_attempt(4),
+    reraise=True,
+)
+
+
+@_openai_retry
+async def create_chat_completion(*, max_tokens, **kwargs):
+    """
+    Call the OpenAI chat completions API within the concurrency limit.
+
+    The read timeout is sized to ``max_tokens`` with completion_timeout().
+    Failed calls are retried; the semaphore is released while waiting so
+    other calls can proceed.
+    """
+    timeout = httpx.Timeout(completion_timeout(max_tokens), connect=OPENAI_HTTP_TIMEOUT.connect)
+    async with get_openai_semaphore():
+        return await get_openai_client().chat.completions.create(max_tokens=max_tokens, timeout=timeout, **kwargs)
+
+
+@_openai_retry
+async def _open_chat_completion_stream(**kwargs):
+    semaphore = get_openai_semaphore()
+    await semaphore.acquire()
+    try:
+        return semaphore, await get_openai_client().chat.completions.create(stream=True, **kwargs)
+    except BaseException:
+        semaphore.release()
+        raise
+
+
+@contextlib.asynccontextmanager
+async def stream_chat_completion(**kwargs):
+    """
+    Stream a chat completion, holding a slot of the concurrency limit until
+    the block exits rather than only until the stream is opened.
+
+    Opening the stream is retried like create_chat_completion().
+    """
+    semaphore, completion = await _open_chat_completion_stream(**kwargs)
+    try:
+        yield completion
+    finally:
+        semaphore.release()
+        await completion.close()
+
+
+def normalize_code(code):
+    """
+    Normalize code so trivially different submissions share a cache entry.
+
+    Line endings are unified and trailing whitespace is removed. Leading
+    lines are kept so the line numbers reported by the AI stay correct.
+    """
+    lines = code.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).rstrip('\n')
+
+
+def is_comment_only(code, language):
+    """
+    Return True if every non-blank line of code is inside a comment.
+
+    Lines within a block comment count whatever they start with, but code
+    after a block comment closes on the same line does not.
+    """
+    line_prefix, block = COMMENT_SYNTAX.get(language, DEFAULT_COMMENT_SYNTAX)
+    in_block = False
+    for line in code.split('\n'):
+        line = line.strip()
+        if in_block:
+            if block[1] not in line:
+                continue
+            line = line.split(block[1], 1)[1].strip()
+            in_block = False
+        while block and line.startswith(block[0]):
+            rest = line[len(block[0]):]
+            if block[1] not in rest:
+                in_block = True
+                line = ''
+                break
+            line = rest.split(block[1], 1)[1].strip()
+        if line and not line.startswith(line_prefix):
+            return False
+    return True
+
+
+def is_trivial_code(code, language):
+    """
+    Return True if code is too trivial to be worth an AI review.
+
+    That is very short code, code made only of comments, or Python code
+    that is a single ``pass``, literal, or ``print`` of literals.
+    """
+    stripped = code.strip()
+    if len(stripped) < TRIVIAL_CODE_LENGTH:
+        return True
+
+    if is_comment_only(stripped, language):
+        return True
+
+    if language == 'python':
+        try:
+            tree = ast.parse(stripped)
+        except SyntaxError:
+            # Broken code is exactly what a review should point out
+            return False
+        if len(tree.body) == 1:
+            node = tree.body[0]
+            if isinstance(node, ast.Pass):
+                return True
+            if isinstance(node, ast.Expr):
+                return _is_literal_expression(node.value)
+    return False
+
+
+def _is_literal_expression(node):
+    # Calls other than print() of literals can do anything, so they get a review
+    if (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Name)
+        and node.func.id == 'print'
+    ):
+        return all(_is_literal_expression(arg) for arg in node.args) and all(
+            _is_literal_expression(keyword.value) for keyword in node.keywords
+        )
+    try:
+        ast.literal_eval(node)
+    except (ValueError, TypeError):
+        return False
+    return True
+
+
+def review_cache_key(code, language, model=AI_MODEL, temperature=AI_TEMPERATURE, max_tokens=AI_MAX_TOKENS,
+                     prompt="review"):
+    """
+    Build the cache key for a review of normalized code.
+
+    Every parameter that changes the AI output is part of the key.
+    ``prompt`` names the prompt the review came from: ``"review"`` for a
+    single review and ``"batch"`` for an item of a batch, which is reviewed
+    alongside other snippets and so is never shared with single reviews.
+    """
+    raw = f"{prompt}|{model}|{temperature}|{max_tokens}|{language}|{code}"
+    return REVIEW_CACHE_PREFIX + hashlib.sha256(raw.encode()).hexdigest()
+
+
+def parse_ai_json(review_text, expected=dict):
+    """
+    Parse the JSON returned by the AI, tolerating a markdown code block.
+
+    ``expected`` is the top-level type asked for, ``dict`` for a review or
+    ``list`` for a batch, so brackets in any text around it are skipped.
+
+    Raises:
+        orjson.JSONDecodeError: If the response is not valid JSON
+    """
+    match = _AI_JSON_RES[expected].search(review_text)
+    payload = (match.group(1) or match.group(2)) if match else review_text
+    return orjson.loads(payload)
+
+
+def chunk_batch_items(items, model=AI_MODEL):
+    """
+    Split (index, code, language) items into chunks that fit one prompt.
+
+    Chunks are cut once the input size would exceed
+    BATCH_MAX_INPUT_TOKENS; an oversized item still gets a chunk of its own.
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+    for item in items:
+        item_tokens = count_tokens(item[1], model)
+        if current and current_tokens + item_tokens > BATCH_MAX_INPUT_TOKENS:
+            chunks.append(current)
+            current = []
+            current_tokens = 0
+        current.append(item)
+        current_tokens += item_tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def review_batch_chunk(chunk, model):
+    """
+    Review a chunk of (index, code, language) items with a single AI call.
+
+    Returns:
+        dict mapping item index to its review (issues, summary, score)
+    """
+    items_text = "\n".join(
+        BATCH_ITEM_TEMPLATE.format(index=index, language=language, code=code)
+        for index, code, language in chunk
+    )
+    response = await create_chat_completion(
+        model=model,
+        messages=[
+            SYSTEM_MESSAGE,
+            {"role": "user", "content": BATCH_PROMPT_TEMPLATE.format(items=items_text)}
+        ],
+        temperature=AI_TEMPERATURE,
+        max_tokens=min(
+            sum(review_max_tokens(count_tokens(code, model)) for _, code, _ in chunk),
+            BATCH_MAX_OUTPUT_TOKENS
+        ),
+    )
+    review_list = parse_ai_json(response.choices[0].message.content.strip(), list)
+    if not isinstance(review_list, list):
+        raise ValueError("AI batch response is not a JSON array")
+
+    reviews = {}
+    for entry in review_list:
+        if isinstance(entry, dict) and isinstance(entry.get('index'), int):
+            index = entry.pop('index')
+            reviews[index] = entry
+    return reviews
+
+
+async def get_cached_review(key):
+    """
+    Look up a review in the in-process cache, then in the shared cache.
+    """
+    with _local_review_cache_lock:
+        entry = _local_review_cache.get(key)
+        if entry is not None:
+            expires_at, review = entry
+            if expires_at > time.monotonic():
+                _local_review_cache.move_to_end(key)
+                return review
+            _local_review_cache.pop(key, None)
+
+    review = await cache.aget(key)
+    if review is not None:
+        _remember_review(key, review)
+    return review
+
+
+async def set_cached_review(key, review):
+    """
+    Store a review in both the in-process and the shared cache.
+    """
+    _remember_review(key, review)
+    await cache.aset(key, review, timeout=settings.REVIEW_CACHE_TTL)
+
+
+def _remember_review(key, review):
+    with _local_review_cache_lock:
+        _local_review_cache[key] = (time.monotonic() + settings.REVIEW_CACHE_TTL, review)
+        _local_review_cache.move_to_end(key)
+        while len(_local_review_cache) > LOCAL_REVIEW_CACHE_SIZE:
+            _local_review_cache.popitem(last=False)
+
+
+def build_review_messages(language, code):
+    """
+    Build the chat messages asking the AI to review a single snippet.
+    """
+    return [
+        SYSTEM_MESSAGE,
+        {"role": "user", "content": REVIEW_PROMPT_TEMPLATE.format(language=language, code=code)}
+    ]
+
+
+def ndjson_line(payload):
+    """
+    Encode one newline-delimited JSON record.
+    """
+    return orjson.dumps(payload) + b"\n"
+
+
+def review_response(review_data, start_time, stream=False, headers=None):
+    """
+    Build the response for a finished review.
+
+    Streaming clients always receive NDJSON, so a review that is already
+    available is sent as a single ``review`` record.
+    """
+    payload = {
+        'review': review_data,
+        'response_time': round(time.perf_counter() - start_time, 2)
+    }
+    if stream:
+        async def single_record():
+            yield ndjson_line({'type': 'review', **payload})
+        return StreamingHttpResponse(single_record(), content_type='application/x-ndjson', headers=headers)
+    return Response(payload, status=status.HTTP_200_OK, headers=headers)
+
+
+async def stream_review(cache_key, model, language, code, code_length, max_tokens, start_time, shared):
+    """
+    Stream a review as NDJSON while the AI generates it.
+
+    Yields ``delta`` records with each chunk of AI output, then a single
+    ``review`` record once the full response has been parsed and cached,
+    or an ``error`` record if the AI call or parsing fails. ``shared`` is
+    passed to openai_request_scope(); the stream outlives the view, so it
+    manages its own scope.
+    """
+    async with openai_request_scope(shared):
+        parts = []
+        try:
+            async with stream_chat_completion(
+                model=model,
+                messages=build_review_messages(language, code),
+                temperature=AI_TEMPERATURE,
+                max_tokens=max_tokens,
+            ) as completion:
+                async for chunk in completion:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        yield ndjson_line({'type': 'delta', 'content': delta})
+            review_data = parse_ai_json(''.join(parts).strip())
+        except orjson.JSONDecodeError as e:
+            safe_capture_exception(
+                e,
+                tags={"error_type": "json_parse_error", "language": language, "ai.model": model},
+                extras={"code_length": code_length, "response_preview": ''.join(parts)[:200]}
+            )
+            logger.error(f"Failed to parse AI response: {str(e)}")
+            yield ndjson_line({'type': 'error', 'error': 'Failed to parse AI response'})
+            return
+        except Exception as e:
+            safe_capture_exception(
+                e,
+                tags={"error_type": "openai_api_error", "language": language, "ai.model": model, "service": "openai"},
+                extras={"code_length": code_length, "error_details": str(e)}
+            )
+            logger.error(f"OpenAI API error: {str(e)}")
+            yield ndjson_line({'type': 'error', 'error': 'AI analysis failed'})
+            return
+
+        await set_cached_review(cache_key, review_data)
+        yield ndjson_line({
+            'type': 'review',
+            'review': review_data,
+            'response_time': round(time.perf_counter() - start_time, 2)
+        })
+
+
 class CodeReviewView(APIView):
     """
     API endpoint to review code using AI.
+
+    The handler is a coroutine so that, when served over ASGI, a worker can
+    keep many reviews in flight while waiting on OpenAI instead of blocking
+    a thread per request.
+
+    Send ``"stream": true`` to receive NDJSON records as the AI writes the
+    review instead of waiting for the complete JSON response.
     """
     
-    def post(self, request):
+    async def post(self, request):
         # Start transaction for performance monitoring
-        with sentry_sdk.start_transaction(op="http.server", name="POST /api/review/"):
-            start_time = time.time()
+        with sentry_sdk.start_transaction(op="http.server", name="POST /api/review/") as transaction:
+            start_time = time.perf_counter()
+            # Defaults referenced by the error handlers below
+            code_length = 0
+            language = "unknown"
+            review_text = None
             
             try:
-                code = request.data.get('code', '')
+                if not isinstance(request.data, dict):
+                    return Response(
+                        {'error': 'Request body must be a JSON object'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                code = request.data.get('code') or ''
                 language = request.data.get('language', 'python')
-                code_length = len(code) if code else 0
+                stream = request.data.get('stream') is True
+                if isinstance(code, str):
+                    code_length = len(code)
                 
-                # Set Sentry tags for context
-                sentry_sdk.set_tag("feature", "code-review")
-                sentry_sdk.set_tag("language", language)
-                sentry_sdk.set_tag("ai.model", "gpt-4o-mini")
-                sentry_sdk.set_tag("endpoint", "/api/review/")
-                sentry_sdk.set_context("request", {
-                    "code_length": code_length,
-                    "language": language,
-                    "method": "POST",
-                })
-                #sentry_sdk.capture_exception(Exception("Test code review error"))
+                if not isinstance(language, str):
+                    safe_capture_message(
+                        "Invalid input: non-string language",
+                        level="warning",
+                        tags={"validation_error": "invalid_language"}
+                    )
+                    return Response(
+                        {'error': 'Language must be a string'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
                 
-                # Validate input with performance span
-                with sentry_sdk.start_span(op="validation", description="Validate input"):
-                    if not code or not isinstance(code, str):
-                        safe_capture_message(
-                            "Invalid input: empty or non-string code",
-                            level="warning",
-                            tags={"validation_error": "empty_or_invalid_type", "language": language}
-                        )
-                        return Response(
-                            {'error': 'Code is required and must be a string'},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-                    
-                    if code_length > 10000:
-                        safe_capture_message(
-                            f"Code too long: {code_length} characters",
-                            level="warning",
-                            tags={
-                                "validation_error": "code_too_long",
-                                "language": language,
-                                "code_length": str(code_length)
-                            },
-                            extra={"code_length": code_length, "max_length": 10000}
-                        )
-                        return Response(
-                            {'error': 'Code is too long. Maximum 10000 characters allowed'},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
+                # Set Sentry tags and context once, and only when Sentry is enabled
+                sentry_enabled = sentry_sdk.get_client().is_active()
+                if sentry_enabled:
+                    sentry_sdk.set_tags({
+                        "feature": "code-review",
+                        "language": language,
+                        "endpoint": "/api/review/",
+                        "code_length_bucket": code_length_bucket(code_length),
+                    })
+                    sentry_sdk.set_context("request", {
+                        "code_length": code_length,
+                        "language": language,
+                        "method": "POST",
+                        "temperature": AI_TEMPERATURE,
+                    })
+                
+                # Validate input; empty and non-string code both leave code_length at 0
+                if code_length == 0:
+                    safe_capture_message(
+                        "Invalid input: empty or non-string code",
+                        level="warning",
+                        tags={"validation_error": "empty_or_invalid_type", "language": language}
+                    )
+                    return Response(
+                        {'error': 'Code is required and must be a string'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                
+                if code_length > MAX_CODE_LENGTH:
+                    safe_capture_message(
+                        f"Code too long: {code_length} characters",
+                        level="warning",
+                        tags={
+                            "validation_error": "code_too_long",
+                            "language": language,
+                            "code_length_bucket": code_length_bucket(code_length)
+                        },
+                        extras={"code_length": code_length, "max_length": MAX_CODE_LENGTH}
+                    )
+                    return Response(
+                        {'error': f'Code is too long. Maximum {MAX_CODE_LENGTH} characters allowed'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
                 
                 # Check if OpenAI API key is configured
-                with sentry_sdk.start_span(op="config.check", description="Check OpenAI configuration"):
-                    if not settings.OPENAI_API_KEY:
-                        error_msg = "OpenAI API key not configured"
-                        safe_capture_message(
-                            error_msg,
-                            level="error",
-                            tags={"error_type": "configuration", "service": "openai"}
-                        )
-                        logger.error(error_msg)
-                        return Response(
-                            {'error': 'AI service not configured'},
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                        )
+                if not settings.OPENAI_API_KEY:
+                    error_msg = "OpenAI API key not configured"
+                    safe_capture_message(
+                        error_msg,
+                        level="error",
+                        tags={"error_type": "configuration", "service": "openai"}
+                    )
+                    logger.error(error_msg)
+                    return Response(
+                        {'error': 'AI service not configured'},
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                    )
+                
+                # Trivial code gets a canned review without calling OpenAI
+                code = normalize_code(code)
+                if is_trivial_code(code, language):
+                    return review_response(TRIVIAL_REVIEW, start_time, stream)
+                
+                # Pick the model from the normalized code, as the batch view does,
+                # so the same snippet always maps to the same model and cache key
+                model = select_model(len(code), language)
+                if sentry_enabled:
+                    sentry_sdk.set_tag("ai.model", model)
+                
+                max_tokens = review_max_tokens(count_tokens(code, model))
+                
+                # Serve identical reviews from the cache without calling OpenAI
+                cache_key = review_cache_key(code, language, model=model, max_tokens=max_tokens)
+                cached_review = await get_cached_review(cache_key)
+                if cached_review is not None:
+                    return review_response(cached_review, start_time, stream, headers={'X-Cache': 'HIT'})
+                
+                # Stream the review as it is generated
+                if stream:
+                    return StreamingHttpResponse(
+                        stream_review(
+                            cache_key, model, language, code, code_length, max_tokens, start_time,
+                            uses_shared_openai_client(request)
+                        ),
+                        content_type='application/x-ndjson',
+                        headers={'X-Cache': 'MISS'}
+                    )
                 
                 # Analyze code using OpenAI with performance monitoring
                 try:
-                    with sentry_sdk.start_span(op="ai.analysis", description=f"Reviewing {language} code"):
-                        # Set additional context for AI operation
-                        sentry_sdk.set_context("ai_operation", {
-                            "model": "gpt-4o-mini",
-                            "language": language,
-                            "code_length": code_length,
-                            "temperature": 0.3,
-                            "max_tokens": 2000,
-                        })
-                        
-                        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-                        
-                        prompt = f"""Analyze the following {language} code and provide a code review. 
-Return a JSON response with the following structure:
-{{
-    "issues": [
-        {{
-            "line": <line_number>,
-            "severity": "<error|warning|info>",
-            "message": "<description>",
-            "suggestion": "<suggested_fix>"
-        }}
-    ],
-    "summary": "<overall_summary>",
-    "score": <0-100>
-}}
-
-Code to review:
-```
-{code}
-```
-
-Only return the JSON, no other text."""
-
+                    with sentry_sdk.start_span(op="ai.analysis", name=f"Reviewing {language} code") as span:
+                        span.set_data("max_tokens", max_tokens)
                         # OpenAI API call - this will be automatically tracked in the span
-                        response = client.chat.completions.create(
-                            model="gpt-4o-mini",
-                            messages=[
-                                {"role": "system", "content": "You are a code review assistant. Always respond with valid JSON only."},
-                                {"role": "user", "content": prompt}
-                            ],
-                            temperature=0.3,
-                            max_tokens=2000,
-                        )
+                        async with openai_request_scope(uses_shared_openai_client(request)):
+                            response = await create_chat_completion(
+                                model=model,
+                                messages=build_review_messages(language, code),
+                                temperature=AI_TEMPERATURE,
+                                max_tokens=max_tokens,
+                            )
                     
-                    # Parse response with span
-                    with sentry_sdk.start_span(op="response.parse", description="Parse AI response"):
-                        review_text = response.choices[0].message.content.strip()
-                        
-                        # Try to extract JSON from response (handle markdown code blocks)
-                        if review_text.startswith('```'):
-                            # Remove markdown code block markers
-                            review_text = review_text.split('```')[1]
-                            if review_text.startswith('json'):
-                                review_text = review_text[4:]
-                            review_text = review_text.strip()
-                        
-                        review_data = json.loads(review_text)
-                        
-                        # Set success context
-                        if review_data:
-                            sentry_sdk.set_context("ai_response", {
-                                "issues_count": len(review_data.get("issues", [])),
-                                "score": review_data.get("score"),
-                                "has_summary": bool(review_data.get("summary")),
-                            })
-                            sentry_sdk.set_tag("ai.success", "true")
+                    # Parse response
+                    review_text = response.choices[0].message.content.strip()
+                    review_data = parse_ai_json(review_text)
+                    await set_cached_review(cache_key, review_data)
                 
-                except json.JSONDecodeError as e:
+                except orjson.JSONDecodeError as e:
                     error_msg = f"Failed to parse AI response: {str(e)}"
-                    sentry_sdk.set_tag("ai.success", "false")
-                    sentry_sdk.set_tag("error_type", "json_parse_error")
                     safe_capture_exception(
                         e,
                         tags={
                             "error_type": "json_parse_error",
                             "language": language,
-                            "ai.model": "gpt-4o-mini"
+                            "ai.model": model
                         },
-                        extra={
+                        extras={
                             "code_length": code_length,
                             "language": language,
-                            "response_preview": review_text[:200] if 'review_text' in locals() else None
+                            "response_preview": review_text[:200] if review_text is not None else None
                         }
                     )
                     logger.error(error_msg)
@@ -207,17 +904,15 @@ Only return the JSON, no other text."""
                     )
                 except Exception as e:
                     error_msg = f"OpenAI API error: {str(e)}"
-                    sentry_sdk.set_tag("ai.success", "false")
-                    sentry_sdk.set_tag("error_type", "openai_api_error")
                     safe_capture_exception(
                         e,
                         tags={
                             "error_type": "openai_api_error",
                             "language": language,
-                            "ai.model": "gpt-4o-mini",
+                            "ai.model": model,
                             "service": "openai"
                         },
-                        extra={
+                        extras={
                             "code_length": code_length,
                             "language": language,
                             "error_details": str(e)
@@ -230,58 +925,200 @@ Only return the JSON, no other text."""
                     )
                 
                 # Calculate response time and monitor performance
-                response_time = time.time() - start_time
-                
-                # Track performance metrics
-                sentry_sdk.set_measurement("response_time", response_time, unit="second")
-                sentry_sdk.set_tag("response_time_category", 
-                    "slow" if response_time > 5.0 else "normal" if response_time > 2.0 else "fast")
+                response_time = time.perf_counter() - start_time
                 
-                # Track slow responses
-                if response_time > 5.0:
-                    safe_capture_message(
-                        f"Slow code review response: {response_time:.2f}s",
-                        level="warning",
-                        tags={
-                            "performance": "slow_response",
-                            "language": language,
-                            "threshold": "5s"
-                        },
-                        extra={
-                            "response_time": response_time,
-                            "code_length": code_length,
-                            "language": language
-                        }
+                # Track performance metrics; response time reports are sent in the
+                # background, keeping the request's Sentry scope
+                if sentry_enabled:
+                    transaction.set_data("response_time", response_time)
+                    sentry_sdk.set_tag(
+                        "response_time_category",
+                        "slow" if response_time > 5.0 else "normal" if response_time > 2.0 else "fast"
                     )
-                elif response_time > 2.0:
-                    # Log normal response times at info level
-                    safe_capture_message(
-                        f"Code review completed: {response_time:.2f}s",
-                        level="info",
-                        tags={
-                            "performance": "normal_response",
-                            "language": language
-                        }
+                    _telemetry_executor.submit(
+                        contextvars.copy_context().run,
+                        emit_review_telemetry, response_time, code_length, language
                     )
                 
                 return Response({
                     'review': review_data,
                     'response_time': round(response_time, 2)
-                }, status=status.HTTP_200_OK)
+                }, status=status.HTTP_200_OK, headers={'X-Cache': 'MISS'})
                 
             except Exception as e:
                 error_msg = f"Unexpected error in code review: {str(e)}"
-                sentry_sdk.set_tag("error_type", "unexpected_error")
                 safe_capture_exception(
                     e,
                     tags={
                         "error_type": "unexpected_error",
-                        "language": language if 'language' in locals() else "unknown",
+                        "language": language,
                         "endpoint": "/api/review/"
                     },
-                    extra={
-                        "code_length": code_length if 'code_length' in locals() else 0,
-                        "language": language if 'language' in locals() else "unknown"
+                    extras={
+                        "code_length": code_length,
+                        "language": language
+                    }
+                )
+                logger.error(error_msg, exc_info=True)
+                return Response(
+                    {'error': 'An unexpected error occurred'},
+                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                )
+
+
+class CodeReviewBatchView(APIView):
+    """
+    API endpoint to review several code snippets in one request.
+
+    Snippets are packed into as few OpenAI calls as possible (one per chunk
+    of roughly BATCH_MAX_INPUT_TOKENS), the chunks are reviewed concurrently
+    and the combined answers are split back into one result per snippet.
+    A failed chunk only fails its own items.
+    """
+
+    async def post(self, request):
+        with sentry_sdk.start_transaction(op="http.server", name="POST /api/review/batch/") as transaction:
+            start_time = time.perf_counter()
+            
+            try:
+                if not isinstance(request.data, dict):
+                    return Response(
+                        {'error': 'Request body must be a JSON object'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                items = request.data.get('items')
+
+                sentry_enabled = sentry_sdk.get_client().is_active()
+                if sentry_enabled:
+                    sentry_sdk.set_tags({
+                        "feature": "code-review-batch",
+                        "endpoint": "/api/review/batch/",
+                    })
+
+                if not isinstance(items, list) or not items:
+                    return Response(
+                        {'error': 'items is required and must be a non-empty list'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                if len(items) > BATCH_MAX_ITEMS:
+                    return Response(
+                        {'error': f'Too many items. Maximum {BATCH_MAX_ITEMS} items allowed'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+
+                pending = []
+                for index, item in enumerate(items):
+                    code = item.get('code') if isinstance(item, dict) else None
+                    if not code or not isinstance(code, str):
+                        return Response(
+                            {'error': f'Item {index}: code is required and must be a string'},
+                            status=status.HTTP_400_BAD_REQUEST
+                        )
+                    if len(code) > MAX_CODE_LENGTH:
+                        return Response(
+                            {'error': f'Item {index}: code is too long. Maximum {MAX_CODE_LENGTH} characters allowed'},
+                            status=status.HTTP_400_BAD_REQUEST
+                        )
+                    language = item.get('language', 'python')
+                    if not isinstance(language, str):
+                        return Response(
+                            {'error': f'Item {index}: language must be a string'},
+                            status=status.HTTP_400_BAD_REQUEST
+                        )
+                    pending.append((index, normalize_code(code), language))
+
+                if sentry_enabled:
+                    sentry_sdk.set_context("request", {
+                        "items_count": len(items),
+                        "method": "POST",
+                    })
+
+                # Serve what we can from the cache and only send the rest to OpenAI
+                results = [None] * len(items)
+                uncached_by_model = {}
+                cache_keys = {}
+                for index, code, language in pending:
+                    if is_trivial_code(code, language):
+                        results[index] = {'index': index, 'review': TRIVIAL_REVIEW, 'cached': False}
+                        continue
+                    model = select_model(len(code), language)
+                    cache_keys[index] = review_cache_key(
+                        code, language, model=model,
+                        max_tokens=review_max_tokens(count_tokens(code, model)),
+                        prompt="batch"
+                    )
+                    cached_review = await get_cached_review(cache_keys[index])
+                    if cached_review is not None:
+                        results[index] = {'index': index, 'review': cached_review, 'cached': True}
+                    else:
+                        uncached_by_model.setdefault(model, []).append((index, code, language))
+
+                if uncached_by_model and not settings.OPENAI_API_KEY:
+                    error_msg = "OpenAI API key not configured"
+                    safe_capture_message(
+                        error_msg,
+                        level="error",
+                        tags={"error_type": "configuration", "service": "openai"}
+                    )
+                    logger.error(error_msg)
+                    return Response(
+                        {'error': 'AI service not configured'},
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                    )
+
+                # Each chunk targets one model; chunks are reviewed concurrently,
+                # bounded by OPENAI_MAX_CONCURRENCY
+                chunks = [
+                    (model, chunk)
+                    for model, model_items in uncached_by_model.items()
+                    for chunk in chunk_batch_items(model_items, model)
+                ]
+                with sentry_sdk.start_span(op="ai.analysis", name=f"Reviewing batch in {len(chunks)} chunks"):
+                    async with openai_request_scope(uses_shared_openai_client(request)):
+                        chunk_reviews = await asyncio.gather(
+                            *(review_batch_chunk(chunk, model) for model, chunk in chunks),
+                            return_exceptions=True
+                        )
+
+                for (model, chunk), reviews in zip(chunks, chunk_reviews):
+                    if isinstance(reviews, BaseException):
+                        error_type = "json_parse_error" if isinstance(reviews, ValueError) else "openai_api_error"
+                        safe_capture_exception(
+                            reviews,
+                            tags={
+                                "error_type": error_type,
+                                "ai.model": model,
+                                "endpoint": "/api/review/batch/"
+                            },
+                            extras={"chunk_size": len(chunk)}
+                        )
+                        logger.error(f"Batch review failed: {str(reviews)}")
+                        reviews = {}
+
+                    for index, code, language in chunk:
+                        review_data = reviews.get(index)
+                        if review_data is None:
+                            results[index] = {'index': index, 'error': 'AI analysis failed'}
+                            continue
+                        await set_cached_review(cache_keys[index], review_data)
+                        results[index] = {'index': index, 'review': review_data, 'cached': False}
+
+                response_time = time.perf_counter() - start_time
+                if sentry_enabled:
+                    transaction.set_data("response_time", response_time)
+
+                return Response({
+                    'results': results,
+                    'response_time': round(response_time, 2)
+                }, status=status.HTTP_200_OK)
+                
+            except Exception as e:
+                error_msg = f"Unexpected error in batch code review: {str(e)}"
+                safe_capture_exception(
+                    e,
+                    tags={
+                        "error_type": "unexpected_error",
+                        "endpoint": "/api/review/batch/"
                     }
                 )
                 logger.error(error_msg, exc_info=True)